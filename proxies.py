@@ -1,4 +1,7 @@
+import os
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
 import re
 import json
 from datetime import datetime
@@ -6,6 +9,11 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
 import random
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 SOURCES = [
     "https://api.proxyscrape.com/v3/free-proxy-list/get?request=displayproxies&protocol=http",
     "https://www.proxyscan.io/api/proxy?format=txt&type=http&limit=1000",
@@ -15,6 +23,32 @@ SOURCES = [
     "https://raw.githubusercontent.com/clarketm/proxy-list/master/proxy-list.txt"
 ]
 
+MAX_WORKERS = 10
+
+STREAM_CHUNK_SIZE = 65536
+
+FETCH_TIMEOUT = (3, 8)  # connect/read seconds for each source request
+FETCH_DEADLINE = 20     # seconds before sources that are still running are given up on
+FETCH_RETRIES = 2
+RETRY_BACKOFF = 0.3     # seconds, doubled after each retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Per-source cache of the last good response, revalidated with ETag/Last-Modified
+SOURCE_CACHE_FILE = ".cache/sources.json"
+SOURCE_CACHE_TTL = 300        # seconds a cached list is reused without asking the source
+STALE_IF_ERROR = 60 * 60      # seconds a cached list may stand in for a failing source
+
+# A single stripped ip:port line, matched against raw response bytes so
+# bodies never need decoding. Octets (0-255) and the port (1-65535) are
+# range-checked by the pattern itself, and neither may have leading zeros.
+_OCTET = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)'
+_PORT = r'(?:6553[0-5]|655[0-2]\d|65[0-4]\d\d|6[0-4]\d{3}|[1-5]\d{4}|[1-9]\d{0,3})'
+_PROXY_RE = re.compile(rf'{_OCTET}(?:\.{_OCTET}){{3}}:{_PORT}'.encode())
+
+# README status lines rewritten on every run
+_LAST_UPDATED_RE = re.compile(r'\*\*Last Updated:\*\*.*')
+_TOTAL_PROXIES_RE = re.compile(r'\*\*Total Proxies:\*\*.*')
+
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -22,98 +56,236 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0.3 Safari/605.1.15"
 ]
 
+DEFAULT_README = """# Advanced Proxy List
+
+Automatically updated repository of free public proxies. Hourly refreshed HTTP/HTTPS proxies in both TXT and JSON formats.
+
+## Features
+- Multiple reliable sources
+- Concurrent fetching for faster updates
+- Both TXT and JSON formats
+- Detailed metadata
+- Web interface for easy browsing
+"""
+
 def get_random_user_agent():
     return random.choice(USER_AGENTS)
 
-def fetch_proxies(url):
+def create_session():
+    # One shared session so every fetch thread reuses pooled keep-alive connections
+    session = requests.Session()
+    # Retries are done in fetch_proxies so they can respect the fetch deadline
+    adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS * 2)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_SESSION = create_session()
+
+def dump_json(data):
+    # orjson is much faster at indented output; fall back to the stdlib if missing
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode()
+
+def load_json(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+def is_cache_entry(entry):
+    return (
+        isinstance(entry, dict)
+        and isinstance(entry.get("fetched_at"), (int, float))
+        and isinstance(entry.get("proxies"), list)
+        and all(isinstance(p, str) for p in entry["proxies"])
+        and all(isinstance(entry.get(k), (str, type(None))) for k in ("etag", "last_modified"))
+    )
+
+def load_source_cache():
     try:
-        headers = {
-            'User-Agent': get_random_user_agent()
-        }
-        response = requests.get(url, headers=headers, timeout=20)
-        if response.status_code == 200:
-            proxies = set()
-            for line in response.text.split('\n'):
-                line = line.strip()
-                if re.match(r'^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}:\d+$', line):
-                    proxies.add(line)
-            return proxies
-    except Exception as e:
-        print(f"Error fetching {url}: {str(e)}")
-    return set()
+        with open(SOURCE_CACHE_FILE, "rb") as f:
+            cache = load_json(f.read())
+    except (FileNotFoundError, ValueError):
+        return {}
+    # Treat a cache of the wrong shape like an unreadable one rather than trusting it
+    if not isinstance(cache, dict):
+        return {}
+    return {url: entry for url, entry in cache.items() if is_cache_entry(entry)}
+
+def save_source_cache(cache):
+    os.makedirs(os.path.dirname(SOURCE_CACHE_FILE), exist_ok=True)
+    with open(SOURCE_CACHE_FILE, "wb") as f:
+        f.write(dump_json(cache))
+
+def iter_chunks(response):
+    # read1 (urllib3 2.3+) returns whatever has already arrived instead of waiting for
+    # a full chunk; older urllib3 falls back to iter_content, which may wait for up to
+    # STREAM_CHUNK_SIZE bytes, so a trickling source can overrun the deadline there
+    raw = response.raw
+    if hasattr(raw, "read1"):
+        while True:
+            chunk = raw.read1(STREAM_CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    else:
+        yield from response.iter_content(STREAM_CHUNK_SIZE)
+
+def read_lines(response, deadline):
+    # Each read's socket timeout is capped by the time left, so a source that
+    # trickles bytes or goes silent is cut off at the deadline rather than after it
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    chunks = iter_chunks(response)
+    pending = b""
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("fetch deadline exceeded")
+        if sock is not None:
+            sock.settimeout(min(FETCH_TIMEOUT[1], remaining))
+        chunk = next(chunks, b"")
+        if not chunk:
+            if pending:
+                yield pending
+            return
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+
+def fetch_proxies(url, cached=None, deadline=None):
+    # Returns (proxies, cache entry); the entry is None when nothing is worth caching
+    if cached and time.time() - cached["fetched_at"] < SOURCE_CACHE_TTL:
+        return {p.encode() for p in cached["proxies"]}, cached
+    if deadline is None:
+        deadline = time.monotonic() + FETCH_DEADLINE
+    headers = {
+        'User-Agent': get_random_user_agent()
+    }
+    # Revalidate the cached copy so unchanged lists come back as a bodyless 304
+    if cached and cached.get("etag"):
+        headers['If-None-Match'] = cached["etag"]
+    if cached and cached.get("last_modified"):
+        headers['If-Modified-Since'] = cached["last_modified"]
+    for attempt in range(FETCH_RETRIES + 1):
+        if attempt:
+            time.sleep(min(RETRY_BACKOFF * 2 ** (attempt - 1), max(deadline - time.monotonic(), 0)))
+        # Never let a single attempt, or a retry, run past what is left of the deadline
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"Timed out fetching {url}")
+            break
+        timeout = (min(FETCH_TIMEOUT[0], remaining), min(FETCH_TIMEOUT[1], remaining))
+        try:
+            # Stream the body and match lines as they arrive instead of buffering it
+            with _SESSION.get(url, headers=headers, timeout=timeout, stream=True) as response:
+                if response.status_code in RETRY_STATUSES:
+                    print(f"Error fetching {url}: HTTP {response.status_code}")
+                    continue
+                if response.status_code == 304 and cached:
+                    return {p.encode() for p in cached["proxies"]}, dict(cached, fetched_at=time.time())
+                if response.status_code != 200:
+                    print(f"Error fetching {url}: HTTP {response.status_code}")
+                    break
+                proxies = set()
+                for line in read_lines(response, deadline):
+                    line = line.strip()
+                    # Skip the regex for lines already seen; bytes cache their hash for add()
+                    if line not in proxies and _PROXY_RE.fullmatch(line):
+                        proxies.add(line)
+                entry = {
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "fetched_at": time.time(),
+                    "proxies": sorted(p.decode() for p in proxies)
+                }
+                return proxies, entry
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"Error fetching {url}: {str(e)}")
+        except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as e:
+            # Body read failures and the deadline (TimeoutError) are not worth retrying
+            print(f"Error fetching {url}: {str(e)}")
+            break
+    return stale_proxies(url, cached)
+
+def stale_proxies(url, cached):
+    # Fall back to the last good copy of a failing source while it is recent enough
+    if cached and time.time() - cached["fetched_at"] < STALE_IF_ERROR:
+        print(f"Using cached proxies for {url}")
+        return {p.encode() for p in cached["proxies"]}, cached
+    return set(), None
 
 def get_proxies():
     proxies = set()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(fetch_proxies, url) for url in SOURCES]
+    cache = load_source_cache()
+    new_cache = {}
+    deadline = time.monotonic() + FETCH_DEADLINE
+    # Each fetch stops itself at the deadline, so the pool can be joined normally
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_proxies, url, cache.get(url), deadline): url for url in SOURCES}
+        # fetch_proxies handles network failures itself; anything raised here is a bug
+        # and must abort the run rather than publish an empty list
         for future in as_completed(futures):
-            try:
-                proxies.update(future.result())
-            except Exception as e:
-                print(f"Error processing future: {str(e)}")
+            result, entry = future.result()
+            proxies.update(result)
+            if entry is not None:
+                new_cache[futures[future]] = entry
+    save_source_cache(new_cache)
     return sorted(proxies)
 
-def save_proxies(proxies):
+def save_proxies(proxies, updated=None):
+    updated = updated or datetime.utcnow()
     # Save as TXT
-    with open("proxies.txt", "w") as f:
-        f.write("\n".join(proxies))
+    with open("proxies.txt", "wb") as f:
+        f.writelines(p + b"\n" for p in proxies)
     
     # Save as JSON with metadata
     proxy_data = {
         "metadata": {
-            "last_updated": datetime.utcnow().isoformat() + "Z",
+            "last_updated": updated.isoformat() + "Z",
             "count": len(proxies),
             "sources": SOURCES
         },
-        "proxies": proxies
+        "proxies": [p.decode() for p in proxies]
     }
-    with open("proxies.json", "w") as f:
-        json.dump(proxy_data, f, indent=2)
+    # Serialize once and write the same payload to both locations
+    payload = dump_json(proxy_data)
+    with open("proxies.json", "wb") as f:
+        f.write(payload)
     
     # Save for website
-    with open("docs/proxies.json", "w") as f:
-        json.dump(proxy_data, f, indent=2)
+    os.makedirs("docs", exist_ok=True)
+    with open("docs/proxies.json", "wb") as f:
+        f.write(payload)
 
-def update_readme(count):
-    now = datetime.utcnow().strftime("%A %d-%m-%Y %H:%M:%S UTC")
+def update_readme(count, updated=None):
+    now = (updated or datetime.utcnow()).strftime("%A %d-%m-%Y %H:%M:%S UTC")
     try:
         with open("README.md", "r") as f:
-            content = f.read()
+            original = f.read()
     except FileNotFoundError:
-        content = """# Advanced Proxy List
+        original = None
+    content = DEFAULT_README if original is None else original
 
-Automatically updated repository of free public proxies. Hourly refreshed HTTP/HTTPS proxies in both TXT and JSON formats.
-
-## Features
-- Multiple reliable sources
-- Concurrent fetching for faster updates
-- Both TXT and JSON formats
-- Detailed metadata
-- Web interface for easy browsing
-"""
-
-    content = re.sub(
-        r'\*\*Last Updated:\*\*.*',
-        f'**Last Updated:** `{now}`  ',
-        content
-    )
-    
-    content = re.sub(
-        r'\*\*Total Proxies:\*\*.*',
-        f'**Total Proxies:** `{count}`',
-        content
-    )
+    # Only run the substitutions whose status line is actually present
+    if "**Last Updated:**" in content:
+        content = _LAST_UPDATED_RE.sub(f'**Last Updated:** `{now}`  ', content)
+    if "**Total Proxies:**" in content:
+        content = _TOTAL_PROXIES_RE.sub(f'**Total Proxies:** `{count}`', content)
 
-    with open("README.md", "w") as f:
-        f.write(content)
+    if content != original:
+        with open("README.md", "w") as f:
+            f.write(content)
 
 if __name__ == "__main__":
-    start_time = time.time()
+    start_time = time.perf_counter()
     print("Starting proxy update...")
     
     proxies = get_proxies()
-    save_proxies(proxies)
-    update_readme(len(proxies))
+    # One timestamp for the whole run so the JSON metadata and README agree
+    updated = datetime.utcnow()
+    save_proxies(proxies, updated)
+    update_readme(len(proxies), updated)
     
-    elapsed = time.time() - start_time
+    elapsed = time.perf_counter() - start_time
     print(f"Updated {len(proxies)} proxies in {elapsed:.2f} seconds")
\ No newline at end of file